@@ -0,0 +1,14 @@
+"""Warm the tiktoken BPE cache so process start never hits the network.
+
+Run once at image-build / CI time:
+    python scripts/preload_tiktoken.py
+
+Deliberately does not import src.chunking: that pulls in the OpenAI
+client, which needs an API key this environment won't have. The model
+name below must match the one src.chunking tokenizes with.
+"""
+import tiktoken
+
+if __name__ == "__main__":
+    enc = tiktoken.encoding_for_model("gpt-4o-mini")
+    print(f"cached encoding: {enc.name}")
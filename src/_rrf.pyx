@@ -0,0 +1,24 @@
+# cython: boundscheck=False, wraparound=False, language_level=3
+"""Compiled scatter-add kernel for reciprocal_rank_fusion.
+
+Optional: build in place with
+
+    cythonize -i src/_rrf.pyx
+
+src.retriever imports this when present and otherwise falls back to the
+Numba / np.add.at paths, so an uncompiled checkout keeps working.
+"""
+import numpy as np
+
+cimport numpy as cnp
+
+
+def accumulate(cnp.int64_t[::1] inv, cnp.float64_t[::1] weights,
+               Py_ssize_t n_unique):
+    """Sum *weights* into an (n_unique,) array indexed by *inv*."""
+    cdef cnp.ndarray[cnp.float64_t, ndim=1] acc = np.zeros(n_unique)
+    cdef cnp.float64_t[::1] out = acc
+    cdef Py_ssize_t i
+    for i in range(inv.shape[0]):
+        out[inv[i]] += weights[i]
+    return acc
@@ -1,43 +1,127 @@
+import json
+import os
 import re
-from rank_bm25 import BM25Okapi
+import numpy as np
+import scipy.sparse as sp
 
-STOP_WORDS = {
+from src.results import SearchResults, empty_results
+
+BM25_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "bm25")
+
+# ASCII class keeps the C regex engine off the Unicode property tables
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+")
+
+STOP_WORDS = frozenset({
     'the', 'a', 'an', 'is', 'are', 'was', 'were', 'in', 'on', 'at',
     'to', 'for', 'of', 'and', 'or', 'it', 'this', 'that', 'with',
     'by', 'from', 'as', 'be', 'has', 'had', 'have', 'been', 'its',
-}
+})
 
 
 def tokenize(text):
     """Lowercase, extract words, drop stop-words."""
-    tokens = re.findall(r'\b\w+\b', text.lower())
-    return [t for t in tokens if t not in STOP_WORDS]
+    return [t for t in _TOKEN_RE.findall(text.lower())
+            if t not in STOP_WORDS]
 
 
 class BM25Index:
-    def __init__(self):
-        self.index = None
-        self.chunk_ids = []
+    """BM25 (Okapi) over a sparse CSR weight matrix.
+
+    All per-document weights (idf, length-normalized tf) are precomputed
+    at build time, so a query is a single sparse matrix-vector product
+    instead of a Python loop over every document.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.matrix = None      # CSR (num_docs, vocab_size) of BM25 weights
+        self.vocab = {}         # term -> column index
+        self.chunk_ids = np.array([], dtype=object)
 
     def build(self, chunks):
         """Build BM25 index from a list of chunk dicts."""
-        self.chunk_ids = [c["chunk_id"] for c in chunks]
+        self.chunk_ids = np.array([c["chunk_id"] for c in chunks], dtype=object)
         corpus = [tokenize(c["chunk_text"]) for c in chunks]
-        self.index = BM25Okapi(corpus)
-        print(f"  BM25 index built {len(corpus)} chunks")
+
+        self.vocab = {}
+        rows, cols, tfs = [], [], []
+        doc_lens = np.zeros(len(corpus), dtype=np.float64)
+
+        for d, tokens in enumerate(corpus):
+            doc_lens[d] = len(tokens)
+            counts = {}
+            for t in tokens:
+                counts[t] = counts.get(t, 0) + 1
+            for t, tf in counts.items():
+                col = self.vocab.setdefault(t, len(self.vocab))
+                rows.append(d)
+                cols.append(col)
+                tfs.append(tf)
+
+        n_docs = len(corpus)
+        n_terms = len(self.vocab)
+        tf_matrix = sp.csr_matrix(
+            (np.array(tfs, dtype=np.float64), (rows, cols)),
+            shape=(n_docs, n_terms),
+        )
+
+        # idf per Okapi BM25 (with the +1 floor so no term goes negative)
+        df = np.asarray((tf_matrix > 0).sum(axis=0)).ravel()
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+        # length-normalized tf, folded together with idf into one weight
+        avgdl = doc_lens.mean() if n_docs else 1.0
+        norm = self.k1 * (1.0 - self.b + self.b * doc_lens / (avgdl + 1e-10))
+        coo = tf_matrix.tocoo()
+        weights = (idf[coo.col] * coo.data * (self.k1 + 1.0)
+                   / (coo.data + norm[coo.row]))
+        self.matrix = sp.csr_matrix(
+            (weights, (coo.row, coo.col)), shape=(n_docs, n_terms)
+        )
+        print(f"  BM25 index built {n_docs} chunks, {n_terms} terms")
+
+    def save(self, path=None):
+        path = path or BM25_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sp.save_npz(path + ".npz", self.matrix)
+        np.save(path + ".ids.npy", self.chunk_ids)
+        with open(path + ".vocab.json", "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f)
+
+    def load(self, path=None):
+        path = path or BM25_PATH
+        self.matrix = sp.load_npz(path + ".npz")
+        self.chunk_ids = np.load(path + ".ids.npy", allow_pickle=True)
+        with open(path + ".vocab.json", "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+    def _query_vector(self, query):
+        q_vec = np.zeros(len(self.vocab), dtype=np.float64)
+        for t in tokenize(query):
+            col = self.vocab.get(t)
+            if col is not None:
+                q_vec[col] += 1.0
+        return q_vec
+
+    def _top_k(self, scores, top_k):
+        # partial top-k partition in C, then sort just the k survivors
+        k = min(top_k, scores.size)
+        if k == 0:
+            return empty_results()
+        top_idx = np.argpartition(scores, -k)[-k:]
+        top_idx = top_idx[np.argsort(-scores[top_idx])]
+
+        return SearchResults.from_ranked(
+            self.chunk_ids[top_idx], scores[top_idx])
 
     def search(self, query, top_k=5):
-        tokens = tokenize(query)
-        scores = self.index.get_scores(tokens)
-
-        top_idx = sorted(range(len(scores)),
-                         key=lambda i: scores[i], reverse=True)[:top_k]
-
-        results = []
-        for rank, idx in enumerate(top_idx, 1):
-            results.append({
-                "chunk_id": self.chunk_ids[idx],
-                "score": float(scores[idx]),
-                "rank": rank,
-            })
-        return results
+        scores = self.matrix @ self._query_vector(query)
+        return self._top_k(scores, top_k)
+
+    def search_batch(self, queries, top_k=5):
+        """Score many queries with a single sparse matrix-matrix product."""
+        q_mat = np.stack([self._query_vector(q) for q in queries], axis=1)
+        scores = self.matrix @ q_mat    # (num_docs, num_queries)
+        return [self._top_k(scores[:, i], top_k)
+                for i in range(len(queries))]
@@ -1,14 +1,41 @@
+import functools
+import hashlib
+import os
 import re
-import uuid
+from bisect import bisect_left, bisect_right
+
 import tiktoken
 import numpy as np
-from src.embeddings import embed_texts, cosine_similarity
+from src.embeddings import embed_texts, consecutive_cosine_similarities
+
+@functools.lru_cache(maxsize=1)
+def _enc():
+    """Load the tokenizer on first use, not at import.
+
+    encoding_for_model may hit the network (or at least disk) to fetch
+    the BPE ranks; retrieval-only runs import this module without ever
+    counting tokens. scripts/preload_tiktoken.py warms the cache at
+    image-build time.
+    """
+    return tiktoken.encoding_for_model("gpt-4o-mini")
 
-enc = tiktoken.encoding_for_model("gpt-4o-mini")
 
+_HEADING_KEYWORD_RE = re.compile(
+    r'^(Article|Section|Chapter|Part|ARTICLE|SECTION)\s{1,10}\d{1,5}')
+_NUMBERED_SECTION_RE = re.compile(r'^\d{1,4}\.\d{1,4}')
+_WORD_RE = re.compile(r'\S+')
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+|\n{2,}')
 
+
+@functools.lru_cache(maxsize=200_000)
 def count_tokens(text):
-    return len(enc.encode(text))
+    return len(_enc().encode_ordinary(text))
+
+
+def count_tokens_batch(texts):
+    """Token counts for many strings in one call (tiktoken threads internally)."""
+    encoded = _enc().encode_ordinary_batch(texts, num_threads=os.cpu_count())
+    return [len(ids) for ids in encoded]
 
 #  STRUCTURAL CHUNKING (section-aware, 512 tokens) 
 
@@ -35,9 +62,9 @@ def detect_headings(text_blocks):
             is_heading = True
         if b["font_flags"] & (1 << 4) and b["font_size"] >= median_size:
             is_heading = True
-        if re.match(r'^(Article|Section|Chapter|Part|ARTICLE|SECTION)\s+\d+', txt):
+        if _HEADING_KEYWORD_RE.match(txt):
             is_heading = True
-        if re.match(r'^\d+\.\d+', txt):
+        if _NUMBERED_SECTION_RE.match(txt):
             is_heading = True
 
         if is_heading:
@@ -60,13 +87,7 @@ def structural_chunk(page_data, max_tokens=512, overlap_tokens=50):
         return []
 
     heading_texts = detect_headings(text_blocks)
-    heading_positions = []
-    search_from = 0
-    for h in heading_texts:
-        idx = page_text.find(h, search_from)
-        if idx >= 0:
-            heading_positions.append((idx, h))
-            search_from = idx + len(h)
+    heading_positions = _locate_headings(page_text, heading_texts)
     sections = []
     if heading_positions:
         first_pos = heading_positions[0][0]
@@ -90,6 +111,7 @@ def structural_chunk(page_data, max_tokens=512, overlap_tokens=50):
             "char_end": len(page_text),
         })
     chunks = []
+    word_spans = word_starts = None
     for sec in sections:
         raw_text = page_text[sec["char_start"]:sec["char_end"]]
         text, cs, ce = _trim_offsets(raw_text, sec["char_start"])
@@ -101,7 +123,12 @@ def structural_chunk(page_data, max_tokens=512, overlap_tokens=50):
             chunks.append(_make_chunk(doc_id, page_num, cs, ce, text, tokens,
                                        sec["heading"], "structural"))
         else:
-            for sub in _sliding_window_split(text, cs, max_tokens, overlap_tokens):
+            if word_spans is None:
+                word_spans = _page_word_spans(page_text)
+                word_starts = [s for s, _, _ in word_spans]
+            sec_spans = _word_spans_between(word_spans, word_starts, cs, ce)
+            for sub in _sliding_window_split(page_text, sec_spans,
+                                             max_tokens, overlap_tokens):
                 chunks.append(_make_chunk(
                     doc_id, page_num, sub["char_start"], sub["char_end"],
                     sub["text"], count_tokens(sub["text"]),
@@ -109,47 +136,96 @@ def structural_chunk(page_data, max_tokens=512, overlap_tokens=50):
     return chunks
 
 
+def _locate_headings(page_text, heading_texts):
+    """
+    (position, heading) pairs in page order, found in one scan.
+
+    One alternation regex over all headings replaces the per-heading
+    page_text.find chain (O(pages * headings) scans). Each heading is then
+    greedily assigned its first occurrence after the previous heading's
+    end — the same semantics the old find chain had.
+    """
+    if not heading_texts:
+        return []
+
+    pattern = re.compile("|".join(
+        re.escape(h)
+        for h in sorted(set(heading_texts), key=len, reverse=True)))
+    occurrences = {}
+    for m in pattern.finditer(page_text):
+        occurrences.setdefault(m.group(0), []).append(m.start())
+
+    positions = []
+    search_from = 0
+    for h in heading_texts:
+        for idx in occurrences.get(h, ()):
+            if idx >= search_from:
+                positions.append((idx, h))
+                search_from = idx + len(h)
+                break
+    return positions
+
+
 #  SEMANTIC CHUNKING (embedding-similarity threshold)
 
 def _split_sentences(text):
     """Rough sentence splitter (period/!/? followed by space, or double newline)."""
-    parts = re.split(r'(?<=[.!?])\s+|\n{2,}', text)
+    parts = _SENTENCE_SPLIT_RE.split(text)
     return [p.strip() for p in parts if p.strip()]
 
 
-def semantic_chunk(page_data, similarity_threshold=0.75, max_tokens=512):
+def collect_sentences(page_data):
     """
-    Group consecutive sentences whose embeddings are similar.
-    When similarity drops below the threshold a new chunk starts.
+    Sentences and their absolute char spans for one page.
+    Split out of semantic_chunk so the pipeline can embed every page's
+    sentences in a single batched call instead of one call per page.
     """
     page_text = page_data["text"]
-    doc_id = page_data["doc_id"]
-    page_num = page_data["page"]
-
     if not page_text.strip():
-        return []
+        return [], []
 
     sentences = _split_sentences(page_text)
-    if not sentences:
-        return []
-    spans = []     
+    spans = []
     cursor = 0
     for sent in sentences:
         idx = page_text.find(sent, cursor)
         if idx == -1:
-            idx = cursor           
+            idx = cursor
         spans.append((idx, idx + len(sent)))
         cursor = idx + len(sent)
+    return sentences, spans
+
+
+def semantic_chunk(page_data, similarity_threshold=0.75, max_tokens=512):
+    """
+    Group consecutive sentences whose embeddings are similar.
+    When similarity drops below the threshold a new chunk starts.
+    """
+    sentences, spans = collect_sentences(page_data)
+    if not sentences:
+        return []
+    embeddings = embed_texts(sentences) if len(sentences) > 1 else []
+    return semantic_chunk_from_embeddings(
+        page_data, sentences, spans, embeddings,
+        similarity_threshold=similarity_threshold, max_tokens=max_tokens)
+
+
+def semantic_chunk_from_embeddings(page_data, sentences, spans, embeddings,
+                                   similarity_threshold=0.75, max_tokens=512):
+    """Build semantic chunks for one page from precomputed sentence embeddings."""
+    page_text = page_data["text"]
+    doc_id = page_data["doc_id"]
+    page_num = page_data["page"]
+
+    if not sentences:
+        return []
     if len(sentences) == 1:
         cs, ce = spans[0]
         txt = page_text[cs:ce]
         return [_make_chunk(doc_id, page_num, cs, ce, txt,
                             count_tokens(txt), None, "semantic")]
 
-    embeddings = embed_texts(sentences)
-    sims = []
-    for i in range(len(embeddings) - 1):
-        sims.append(cosine_similarity(embeddings[i], embeddings[i + 1]))
+    sims = consecutive_cosine_similarities(embeddings)
 
     # group: break whenever similarity < threshold
     groups = [[0]]
@@ -167,6 +243,7 @@ def semantic_chunk(page_data, similarity_threshold=0.75, max_tokens=512):
         else:
             merged.append(g)
     chunks = []
+    word_spans = word_starts = None
     for group in merged:
         cs = spans[group[0]][0]
         ce = spans[group[-1]][1]
@@ -174,7 +251,12 @@ def semantic_chunk(page_data, similarity_threshold=0.75, max_tokens=512):
         tokens = count_tokens(chunk_text)
 
         if tokens > max_tokens:
-            for sub in _sliding_window_split(chunk_text, cs, max_tokens, 50):
+            if word_spans is None:
+                word_spans = _page_word_spans(page_text)
+                word_starts = [s for s, _, _ in word_spans]
+            group_spans = _word_spans_between(word_spans, word_starts, cs, ce)
+            for sub in _sliding_window_split(page_text, group_spans,
+                                             max_tokens, 50):
                 chunks.append(_make_chunk(
                     doc_id, page_num, sub["char_start"], sub["char_end"],
                     sub["text"], count_tokens(sub["text"]), None, "semantic"))
@@ -193,9 +275,15 @@ def _trim_offsets(text, base_offset):
     return stripped, new_start, new_end
 
 
+def _chunk_id(doc_id, page, cs, ce, mode):
+    """Content-addressed id: re-ingesting the same span yields the same row."""
+    key = f"{doc_id}|{page}|{cs}|{ce}|{mode}"
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
 def _make_chunk(doc_id, page, cs, ce, text, token_count, heading, mode):
     return {
-        "chunk_id": str(uuid.uuid4()),
+        "chunk_id": _chunk_id(doc_id, page, cs, ce, mode),
         "doc_id": doc_id,
         "page": page,
         "char_start": cs,
@@ -207,30 +295,44 @@ def _make_chunk(doc_id, page, cs, ce, text, token_count, heading, mode):
     }
 
 
-def _sliding_window_split(text, base_offset, max_tokens, overlap_tokens):
+def _page_word_spans(page_text):
+    """(start, end, word) spans for a whole page, computed once per page."""
+    return [(m.start(), m.end(), m.group())
+            for m in _WORD_RE.finditer(page_text)]
+
+
+def _word_spans_between(word_spans, word_starts, cs, ce):
+    """Slice of page word spans starting in [cs, ce); a word cut by ce is clamped."""
+    lo = bisect_left(word_starts, cs)
+    hi = bisect_left(word_starts, ce)
+    spans = word_spans[lo:hi]
+    if spans and spans[-1][1] > ce:
+        start, _, word = spans[-1]
+        spans[-1] = (start, ce, word[:ce - start])
+    return spans
+
+
+def _sliding_window_split(page_text, word_spans, max_tokens, overlap_tokens):
     """
-    Split *text* into overlapping windows.
-    Offsets returned are absolute (base_offset + position in *text*).
+    Split the region covered by *word_spans* into overlapping windows.
+    Spans are page-absolute, so returned offsets are too.
     """
-    word_spans = [(m.start(), m.end(), m.group())
-                  for m in re.finditer(r'\S+', text)]
     if not word_spans:
         return []
 
+    # encode each word once; a window's token count is then an O(1)
+    # prefix-sum subtraction instead of re-encoding the whole window
+    word_tokens = count_tokens_batch([w for _, _, w in word_spans])
+    cum = [0]
+    for n in word_tokens:
+        cum.append(cum[-1] + n)
+
     chunks = []
     start_w = 0
 
     while start_w < len(word_spans):
-        end_w = start_w
-        while end_w < len(word_spans):
-            window = text[word_spans[start_w][0]:word_spans[end_w][1]]
-            if count_tokens(window) > max_tokens and end_w > start_w:
-                end_w -= 1
-                break
-            end_w += 1
-        else:
-            end_w -= 1  
-
+        # largest end_w whose window stays within max_tokens
+        end_w = bisect_right(cum, cum[start_w] + max_tokens) - 2
         if end_w < start_w:
             end_w = start_w
 
@@ -238,19 +340,15 @@ def _sliding_window_split(text, base_offset, max_tokens, overlap_tokens):
         ce = word_spans[end_w][1]
 
         chunks.append({
-            "text": text[cs:ce],
-            "char_start": base_offset + cs,
-            "char_end": base_offset + ce,
+            "text": page_text[cs:ce],
+            "char_start": cs,
+            "char_end": ce,
         })
-        next_start = end_w + 1
-        for ow in range(end_w, start_w, -1):
-            overlap_text = text[word_spans[ow][0]:word_spans[end_w][1]]
-            if count_tokens(overlap_text) >= overlap_tokens:
-                next_start = ow
-                break
+        # largest ow whose trailing window carries >= overlap_tokens
+        next_start = bisect_right(cum, cum[end_w + 1] - overlap_tokens) - 1
 
-        if next_start <= start_w:
-            next_start = end_w + 1 
+        if next_start <= start_w or next_start > end_w:
+            next_start = end_w + 1
 
         start_w = next_start
 
@@ -1,7 +1,8 @@
 import re
-from src.db import get_page_text, get_all_chunks
+from bisect import bisect_right
+from collections import defaultdict
 
-PAGE_CACHE = {}
+from src.db import get_page_text, get_page_texts, get_chunk_spans
 
 def extract_citations(answer_text):
     """
@@ -21,35 +22,60 @@ def extract_citations(answer_text):
     return citations
 
 
-def validate_citation(citation, conn):
+def _index_chunks_by_page(conn):
+    """(doc_id, page) -> chunks sorted by char_start.
+
+    Fetches spans only — decoding embedding BLOBs here would cost more
+    than the lookups save.
+    """
+    by_page = defaultdict(list)
+    for chunk in get_chunk_spans(conn):
+        by_page[(chunk["doc_id"], chunk["page"])].append(chunk)
+    for chunks in by_page.values():
+        chunks.sort(key=lambda c: c["char_start"])
+    return by_page
+
+
+def _page_span_text(page_text, cs, ce):
+    """The cited snippet when (cs, ce) resolves against the page text."""
+    if page_text is not None and 0 <= cs < ce <= len(page_text):
+        snippet = page_text[cs:ce]
+        if snippet.strip():
+            return snippet
+    return None
+
+
+def validate_citation(citation, conn, chunks_by_page=None, page_texts=None):
     """
     Check that the cited (doc_id, page, char_start:char_end) actually
     falls inside a stored chunk and that the page text at those offsets
     contains real content.
     """
     key = (citation["doc_id"], citation["page"])
-    if key not in PAGE_CACHE:
-        PAGE_CACHE[key] = get_page_text(conn, citation["doc_id"], citation["page"])
-    page_text = PAGE_CACHE[key]
-
-    if page_text is not None:
-        cs, ce = citation["char_start"], citation["char_end"]
-        if 0 <= cs < ce <= len(page_text):
-            snippet = page_text[cs:ce]
-            if snippet.strip():
-                return {"valid": True, "cited_text": snippet}
-    chunks = get_all_chunks(conn)
-    for chunk in chunks:
-        if chunk["doc_id"] != citation["doc_id"]:
-            continue
-        if chunk["page"] != citation["page"]:
-            continue
-        if (citation["char_start"] >= chunk["char_start"] and
-                citation["char_end"] <= chunk["char_end"]):
-            offset = citation["char_start"] - chunk["char_start"]
-            length = citation["char_end"] - citation["char_start"]
-            cited = chunk["chunk_text"][offset:offset + length]
+    if page_texts is not None:
+        page_text = page_texts.get(key)
+    else:
+        page_text = get_page_text(conn, citation["doc_id"], citation["page"])
+
+    cs, ce = citation["char_start"], citation["char_end"]
+    snippet = _page_span_text(page_text, cs, ce)
+    if snippet is not None:
+        return {"valid": True, "cited_text": snippet}
+
+    if chunks_by_page is None:
+        chunks_by_page = _index_chunks_by_page(conn)
+    page_chunks = chunks_by_page.get(key, [])
+
+    # rightmost chunk starting at or before cs, then walk left across the
+    # (few) overlapping windows that could still contain the span
+    i = bisect_right(page_chunks, cs, key=lambda c: c["char_start"]) - 1
+    while i >= 0:
+        chunk = page_chunks[i]
+        if ce <= chunk["char_end"]:
+            offset = cs - chunk["char_start"]
+            cited = chunk["chunk_text"][offset:offset + (ce - cs)]
             return {"valid": True, "cited_text": cited}
+        i -= 1
 
     return {"valid": False, "cited_text": None}
 
@@ -66,10 +92,22 @@ def compute_grounding(answer_text, conn):
             "details": [],
         }
 
+    # one SQL round trip for every page this answer cites
+    page_texts = get_page_texts(
+        conn, {(c["doc_id"], c["page"]) for c in citations})
+
+    # the chunk-span index only matters when a citation's offsets fail to
+    # resolve against the page text, so build it once, and only then
+    chunks_by_page = None
+    if any(_page_span_text(page_texts.get((c["doc_id"], c["page"])),
+                           c["char_start"], c["char_end"]) is None
+           for c in citations):
+        chunks_by_page = _index_chunks_by_page(conn)
+
     valid_count = 0
     details = []
     for cit in citations:
-        result = validate_citation(cit, conn)
+        result = validate_citation(cit, conn, chunks_by_page, page_texts)
         if result["valid"]:
             valid_count += 1
         details.append({
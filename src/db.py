@@ -16,6 +16,13 @@ def get_connection(db_path=None):
 
 def init_db(db_path=None):
     conn = get_connection(db_path)
+
+    # WAL avoids an fsync per commit; ingestion is I/O-bound without it
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+
     cur = conn.cursor()
 
     cur.execute("""
@@ -62,7 +69,6 @@ def insert_document(conn, doc_id, filename, num_pages):
         "INSERT OR REPLACE INTO documents (doc_id, filename, num_pages) VALUES (?, ?, ?)",
         (doc_id, filename, num_pages)
     )
-    conn.commit()
 
 
 def insert_page(conn, doc_id, page, page_text):
@@ -70,7 +76,6 @@ def insert_page(conn, doc_id, page, page_text):
         "INSERT OR REPLACE INTO pages (doc_id, page, page_text) VALUES (?, ?, ?)",
         (doc_id, page, page_text)
     )
-    conn.commit()
 
 
 def get_page_text(conn, doc_id, page):
@@ -82,6 +87,21 @@ def get_page_text(conn, doc_id, page):
     return row["page_text"] if row else None
 
 
+def get_page_texts(conn, keys):
+    """Page texts for many (doc_id, page) pairs in a single query."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    placeholders = ", ".join(["(?, ?)"] * len(keys))
+    params = [v for key in keys for v in key]
+    rows = conn.execute(
+        f"SELECT doc_id, page, page_text FROM pages"
+        f" WHERE (doc_id, page) IN ({placeholders})",
+        params
+    ).fetchall()
+    return {(r["doc_id"], r["page"]): r["page_text"] for r in rows}
+
+
 def insert_chunk(conn, chunk):
     emb_blob = None
     if chunk.get("embedding") is not None:
@@ -103,9 +123,26 @@ def insert_chunk(conn, chunk):
 
 
 def insert_chunks_batch(conn, chunks):
-    for c in chunks:
-        insert_chunk(conn, c)
-    conn.commit()
+    # pre-serialize outside the SQL path, then one executemany in one txn
+    rows = [
+        (
+            c["chunk_id"], c["doc_id"], c["page"],
+            c["char_start"], c["char_end"],
+            c.get("heading"), c["chunk_text"],
+            c.get("token_count", 0), c["chunk_mode"],
+            (np.asarray(c["embedding"], dtype=np.float32).tobytes()
+             if c.get("embedding") is not None else None),
+        )
+        for c in chunks
+    ]
+    with conn:
+        conn.executemany(
+            """INSERT OR REPLACE INTO chunks
+               (chunk_id, doc_id, page, char_start, char_end,
+                heading, chunk_text, token_count, chunk_mode, embedding)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows,
+        )
 
 
 def get_all_chunks(conn, chunk_mode=None):
@@ -127,6 +164,55 @@ def get_all_chunks(conn, chunk_mode=None):
     return results
 
 
+def get_chunk_spans(conn):
+    """Chunk rows without the embedding BLOB, for citation lookups."""
+    rows = conn.execute(
+        "SELECT chunk_id, doc_id, page, char_start, char_end, chunk_text"
+        " FROM chunks"
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def get_chunks_for_retrieval(conn, chunk_mode=None):
+    """Chunk metadata plus one contiguous float32 embedding matrix.
+
+    Unlike get_all_chunks, embeddings never round-trip through Python
+    lists: each BLOB row is copied straight into its row of a
+    preallocated (N, dim) float32 array. Chunks without embeddings are
+    excluded (they cannot be densely retrieved anyway).
+    """
+    if chunk_mode:
+        rows = conn.execute(
+            "SELECT * FROM chunks WHERE chunk_mode = ? AND embedding IS NOT NULL",
+            (chunk_mode,)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT * FROM chunks WHERE embedding IS NOT NULL"
+        ).fetchall()
+
+    if not rows:
+        return [], np.empty((0, 0), dtype=np.float32)
+
+    dim = len(rows[0]["embedding"]) // 4
+    embeddings = np.empty((len(rows), dim), dtype=np.float32)
+    chunks = []
+    for i, row in enumerate(rows):
+        embeddings[i] = np.frombuffer(row["embedding"], dtype=np.float32)
+        chunks.append({
+            "chunk_id": row["chunk_id"],
+            "doc_id": row["doc_id"],
+            "page": row["page"],
+            "char_start": row["char_start"],
+            "char_end": row["char_end"],
+            "heading": row["heading"],
+            "chunk_text": row["chunk_text"],
+            "token_count": row["token_count"],
+            "chunk_mode": row["chunk_mode"],
+        })
+    return chunks, embeddings
+
+
 def get_chunk_by_id(conn, chunk_id):
     row = conn.execute(
         "SELECT * FROM chunks WHERE chunk_id = ?", (chunk_id,)
@@ -1,6 +1,8 @@
 import openai
 import os
+import time
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,22 +10,67 @@ load_dotenv()
 client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 MODEL = "text-embedding-3-small"
 
+# text-embedding-3 vectors come back L2-normalized from the API, so
+# consumers can treat inner product as cosine without re-normalizing
+UNIT_NORM = True
+
+BATCH_SIZE = 512           # inputs per request
+MAX_BATCH_TOKENS = 250_000  # endpoint rejects ~300k+ tokens/request; headroom
+MAX_WORKERS = 8
+MAX_RETRIES = 5
+
+
+def _embed_batch(batch, model):
+    """One embeddings request with exponential backoff on rate limits."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            resp = client.embeddings.create(input=batch, model=model)
+            return [item.embedding for item in resp.data]
+        except openai.RateLimitError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def _make_batches(texts):
+    """Pack texts into request batches under both endpoint limits.
+
+    The embeddings endpoint caps the input count per request and,
+    separately, the total tokens per request — a count-only split of
+    full-size chunks blows the token cap and gets a 400 back. Token
+    counts are estimated at ~4 chars/token, which is plenty accurate
+    for a budget with headroom.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for t in texts:
+        t = t if t.strip() else " "
+        est_tokens = len(t) // 4 + 1
+        if batch and (len(batch) >= BATCH_SIZE
+                      or batch_tokens + est_tokens > MAX_BATCH_TOKENS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(t)
+        batch_tokens += est_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
 
 def embed_texts(texts, model=MODEL):
     """Embed a list of strings. Returns list of 1536-dim vectors."""
     if not texts:
         return []
 
-    batch_size = 100
-    all_embeddings = []
+    batches = _make_batches(texts)
 
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i : i + batch_size]
-        batch = [t if t.strip() else " " for t in batch]
-
-        resp = client.embeddings.create(input=batch, model=model)
-        all_embeddings.extend([item.embedding for item in resp.data])
+    # I/O-bound HTTP calls — fire batches concurrently, keep input order
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        results = pool.map(lambda b: _embed_batch(b, model), batches)
 
+    all_embeddings = []
+    for embs in results:
+        all_embeddings.extend(embs)
     return all_embeddings
 
 
@@ -36,3 +83,39 @@ def embed_query(query, model=MODEL):
 def cosine_similarity(a, b):
     a, b = np.array(a), np.array(b)
     return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
+
+
+def quantize_int8(matrix):
+    """Symmetric per-vector int8 scalar quantization.
+
+    Returns (codes, scales): int8 codes 4x smaller than float32, and the
+    per-vector float32 scale needed to reconstruct score magnitudes.
+    """
+    m = np.ascontiguousarray(matrix, dtype=np.float32)
+    scales = np.abs(m).max(axis=1, keepdims=True) + 1e-10
+    codes = np.round(m / scales * 127.0).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def int8_scores(codes, scales, query):
+    """Dot-product scores of one float32 query against int8-quantized vectors.
+
+    The matmul runs in integer arithmetic (VNNI-friendly); the combined
+    scales rescale the result back to the float dot product.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    q_scale = np.abs(query).max() + 1e-10
+    q_codes = np.round(query / q_scale * 127.0).astype(np.int8)
+    raw = codes.astype(np.int32) @ q_codes.astype(np.int32)
+    return raw * (scales.ravel() * q_scale / (127.0 * 127.0))
+
+
+def consecutive_cosine_similarities(embeddings):
+    """Cosine similarity between each embedding and the next, vectorized.
+
+    One normalize + one fused multiply-sum over the whole (N, D) matrix
+    instead of N-1 scalar cosine_similarity calls.
+    """
+    E = np.asarray(embeddings, dtype=np.float32)
+    E = E / (np.linalg.norm(E, axis=1, keepdims=True) + 1e-10)
+    return (E[:-1] * E[1:]).sum(axis=1)
@@ -1,6 +1,16 @@
 import fitz
 import os
 import re
+from multiprocessing import Pool
+
+# dict extraction without image blocks: images are dropped inside MuPDF
+# instead of being built into Python dicts we immediately skip
+_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# bounded quantifiers keep matching linear-time on pathological lines
+_CAPTION_RE = re.compile(
+    r'((?:Figure|Fig\.|Table)\s{1,10}\d{1,4}[\.\:][^\n]{0,200})',
+    re.IGNORECASE)
 
 
 def extract_pages(pdf_path):
@@ -13,21 +23,25 @@ def extract_pages(pdf_path):
     for page_num in range(len(doc)):
         page = doc[page_num]
 
-        # full page text 
-        page_text = page.get_text("text")
+        # one parse per page: build page text and span metadata from the
+        # same dict extraction instead of parsing the page twice
         text_blocks = []
-        raw_dict = page.get_text("dict")
+        line_texts = []
+        raw_dict = page.get_text("dict", flags=_TEXT_FLAGS, sort=True)
         for block in raw_dict.get("blocks", []):
             if block.get("type") != 0:
                 continue
             for line in block.get("lines", []):
-                for span in line.get("spans", []):
+                spans = line.get("spans", [])
+                for span in spans:
                     text_blocks.append({
                         "text": span["text"],
                         "font_size": span["size"],
                         "font_flags": span["flags"],
                         "bbox": span["bbox"],
                     })
+                line_texts.append("".join(s["text"] for s in spans))
+        page_text = "\n".join(line_texts)
 
         # tables
         tables = []
@@ -81,32 +95,32 @@ def _table_to_markdown(table_data):
 
 def _find_figure_captions(page_text):
     captions = []
-    patterns = [
-        r'(Figure\s+\d+[\.\:].*?)(?:\n|$)',
-        r'(Fig\.\s+\d+[\.\:].*?)(?:\n|$)',
-        r'(Table\s+\d+[\.\:].*?)(?:\n|$)',
-    ]
-    for pat in patterns:
-        for m in re.finditer(pat, page_text, re.IGNORECASE):
-            captions.append({
-                "text": m.group(1).strip(),
-                "char_start": m.start(),
-                "char_end": m.end(),
-            })
+    for m in _CAPTION_RE.finditer(page_text):
+        captions.append({
+            "text": m.group(1).strip(),
+            "char_start": m.start(),
+            "char_end": m.end(),
+        })
     return captions
 
 
 def ingest_pdf_folder(pdf_folder):
     """Process every PDF in a folder and return list of doc dicts."""
-    documents = []
-    for fname in sorted(os.listdir(pdf_folder)):
-        if not fname.lower().endswith(".pdf"):
-            continue
-        path = os.path.join(pdf_folder, fname)
-        print(f"  extracting: {fname}")
-        doc_data = extract_pages(path)
-        documents.append(doc_data)
-        print(f"    -> {doc_data['num_pages']} pages")
+    paths = [
+        os.path.join(pdf_folder, fname)
+        for fname in sorted(os.listdir(pdf_folder))
+        if fname.lower().endswith(".pdf")
+    ]
+
+    # PDFs are independent; extract them in parallel worker processes
+    if len(paths) > 1:
+        with Pool(processes=min(len(paths), os.cpu_count())) as pool:
+            documents = pool.map(extract_pages, paths)
+    else:
+        documents = [extract_pages(p) for p in paths]
 
+    for doc_data in documents:
+        print(f"  extracted: {doc_data['filename']}"
+              f" -> {doc_data['num_pages']} pages")
     print(f"  total docs: {len(documents)}")
     return documents
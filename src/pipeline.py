@@ -2,19 +2,23 @@
 End-to-end RAG pipeline:
   ingest PDFs  ->  chunk  ->  embed  ->  index  ->  retrieve  ->  generate
 """
+import functools
 import os
 import re
 import json
+import string
 import time
 import numpy as np
 from collections import Counter
 
 from src.ingest import ingest_pdf_folder
-from src.chunking import structural_chunk, semantic_chunk
-from src.embeddings import embed_texts
+from src.chunking import (
+    structural_chunk, collect_sentences, semantic_chunk_from_embeddings,
+)
+from src.embeddings import embed_texts, quantize_int8
 from src.db import (
     init_db, insert_document, insert_page,
-    insert_chunks_batch, get_all_chunks, clear_chunks,
+    insert_chunks_batch, get_chunks_for_retrieval, clear_chunks,
 )
 from src.retriever import HybridRetriever
 from src.generator import generate_answer
@@ -26,12 +30,18 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(DATA_DIR, "rag.db")
 QA_PATH = os.path.join(BASE_DIR, "eval", "qa.json")
 
+
+def _emb_paths(chunk_mode):
+    base = os.path.join(DATA_DIR, f"emb_{chunk_mode}")
+    return base + ".npy", base + ".ids.json"
+
 def run_ingestion(chunk_mode="structural"):
     print(f"INGESTION chunk_mode = {chunk_mode}")
     documents = ingest_pdf_folder(PDF_DIR)
     conn = init_db(DB_PATH)
     clear_chunks(conn, chunk_mode=chunk_mode)
     all_chunks = []
+    semantic_pages = []
     for doc in documents:
         insert_document(conn, doc["doc_id"], doc["filename"], doc["num_pages"])
 
@@ -39,38 +49,100 @@ def run_ingestion(chunk_mode="structural"):
             insert_page(conn, doc["doc_id"], page_data["page"], page_data["text"])
 
             if chunk_mode == "structural":
-                chunks = structural_chunk(page_data)
+                all_chunks.extend(structural_chunk(page_data))
             else:
-                chunks = semantic_chunk(page_data)
-
-            all_chunks.extend(chunks)
+                sentences, spans = collect_sentences(page_data)
+                if sentences:
+                    semantic_pages.append((page_data, sentences, spans))
+
+    # documents/pages accumulate in one transaction, committed here
+    conn.commit()
+
+    if semantic_pages:
+        # one batched embedding call for every page's sentences
+        all_sentences = [s for _, sents, _ in semantic_pages for s in sents]
+        sent_embeddings = embed_texts(all_sentences)
+        offset = 0
+        for page_data, sents, spans in semantic_pages:
+            embs = sent_embeddings[offset:offset + len(sents)]
+            offset += len(sents)
+            all_chunks.extend(
+                semantic_chunk_from_embeddings(page_data, sents, spans, embs))
     texts = [c["chunk_text"] for c in all_chunks]
     embeddings = embed_texts(texts)
     for i, c in enumerate(all_chunks):
         c["embedding"] = embeddings[i]
 
+    # sidecar: one pre-L2-normalized contiguous float32 matrix, so
+    # retrieval can mmap it instead of decoding per-chunk BLOBs
+    if all_chunks:
+        emb_matrix = np.array(embeddings, dtype=np.float32)
+        emb_matrix /= np.linalg.norm(emb_matrix, axis=1, keepdims=True) + 1e-10
+        emb_path, ids_path = _emb_paths(chunk_mode)
+        np.save(emb_path, emb_matrix)
+        with open(ids_path, "w", encoding="utf-8") as f:
+            json.dump([c["chunk_id"] for c in all_chunks], f)
+
+        # int8 copy (4x smaller) for memory-tight deployments;
+        # scored via embeddings.int8_scores
+        codes, scales = quantize_int8(emb_matrix)
+        base = emb_path[:-len(".npy")]
+        np.save(base + ".q.npy", codes)
+        np.save(base + ".scales.npy", scales)
+
     insert_chunks_batch(conn, all_chunks)
     conn.close()
     return all_chunks
 
 CHUNK_CACHE = {}
 
+
+def _sidecar_matrix(chunk_mode, chunks):
+    """Embedding matrix from the .npy sidecar, aligned to *chunks* order.
+
+    Rows are already L2-normalized float32. Returns None when the sidecar
+    is missing or stale, in which case the caller keeps the DB-decoded
+    matrix.
+    """
+    emb_path, ids_path = _emb_paths(chunk_mode)
+    if not (os.path.exists(emb_path) and os.path.exists(ids_path)):
+        return None
+    with open(ids_path, "r", encoding="utf-8") as f:
+        ids = json.load(f)
+    row_of = {cid: i for i, cid in enumerate(ids)}
+    try:
+        order = [row_of[c["chunk_id"]] for c in chunks]
+    except KeyError:
+        return None
+
+    emb_matrix = np.load(emb_path, mmap_mode="r")
+    return np.asarray(emb_matrix[order], dtype=np.float32)
+
 def build_retriever(chunk_mode="structural"):
     global CHUNK_CACHE
 
     conn = init_db(DB_PATH)
-    chunks = get_all_chunks(conn, chunk_mode=chunk_mode)
+    chunks, embeddings = get_chunks_for_retrieval(conn, chunk_mode=chunk_mode)
     conn.close()
 
     if not chunks:
         print(f"no chunks for mode '{chunk_mode}' – run ingestion first")
         return None
 
-    # cache chunks in memory so answer_question never hits the DB
+    # sidecar rows were L2-normalized at write time, so the index build
+    # can skip its own normalization pass; the DB path keeps it as a
+    # safety net for rows written before normalization moved here
+    sidecar = _sidecar_matrix(chunk_mode, chunks)
+    normalized = sidecar is not None
+    if sidecar is not None:
+        embeddings = sidecar
+
+    # cache chunk metadata in memory so answer_question never hits the DB
+    # (embeddings live only in the retriever's index)
     CHUNK_CACHE = {c["chunk_id"]: c for c in chunks}
 
     retriever = HybridRetriever()
-    retriever.build(chunks)
+    retriever.build(chunks, embeddings, normalized=normalized)
     return retriever
 
 
@@ -161,12 +233,17 @@ def run_evaluation(qa_path=None, retriever=None,
     return summary, results
 
 
+_CITATION_RE = re.compile(r'\[.*?\]')
+_PUNCT_TABLE = str.maketrans("", "", string.punctuation)
+
+
+@functools.lru_cache(maxsize=4096)
 def normalize_text(text):
-    text = text.lower()
-    text = re.sub(r'\[.*?\]', '', text) 
-    text = re.sub(r'[^\w\s]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    # translate strips punctuation in one C pass; split/join collapses
+    # whitespace without a regex. Cached because gold answers are
+    # re-normalized for every (chunk_mode, retrieval_method) sweep.
+    text = _CITATION_RE.sub('', text.lower()).translate(_PUNCT_TABLE)
+    return ' '.join(text.split())
 
 
 def compute_exact_match(predicted, gold):
@@ -180,12 +257,8 @@ def compute_f1(predicted, gold):
     if not pred_tokens or not gold_tokens:
         return 0.0
 
-    pred_counter = Counter(pred_tokens)
-    gold_counter = Counter(gold_tokens)
-
-    common = 0
-    for tok in pred_counter:
-        common += min(pred_counter[tok], gold_counter.get(tok, 0))
+    # Counter & Counter is a C-level multiset intersection
+    common = sum((Counter(pred_tokens) & Counter(gold_tokens)).values())
 
     if common == 0:
         return 0.0
@@ -0,0 +1,42 @@
+"""Structure-of-arrays container for ranked retrieval results."""
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class SearchResults:
+    """One ranked result list held as parallel arrays (SoA).
+
+    Fusion concatenates and reduces these arrays directly instead of
+    rehashing per-item dicts; to_dicts() restores the old list-of-dicts
+    shape at the API boundary.
+    """
+    chunk_ids: np.ndarray
+    scores: np.ndarray
+    ranks: np.ndarray
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def head(self, n):
+        return SearchResults(
+            self.chunk_ids[:n], self.scores[:n], self.ranks[:n])
+
+    def to_dicts(self):
+        return [
+            {"chunk_id": cid, "score": score, "rank": rank}
+            for cid, score, rank in zip(self.chunk_ids.tolist(),
+                                        self.scores.tolist(),
+                                        self.ranks.tolist())
+        ]
+
+    @classmethod
+    def from_ranked(cls, chunk_ids, scores):
+        """Results already in rank order; ranks become 1..N."""
+        return cls(chunk_ids, scores, np.arange(1, len(chunk_ids) + 1))
+
+
+def empty_results():
+    return SearchResults.from_ranked(
+        np.array([], dtype=object), np.array([], dtype=np.float64))
@@ -1,88 +1,299 @@
+import hashlib
+import math
 import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import numpy as np
 import faiss
 
-from src.embeddings import embed_query
+try:
+    import numba
+except ImportError:     # optional: only pays off on very large fusions
+    numba = None
+
+try:
+    from src import _rrf as _rrf_ext   # cythonize -i src/_rrf.pyx
+except ImportError:
+    _rrf_ext = None
+
+from src.embeddings import embed_query, UNIT_NORM
 from src.bm25 import BM25Index
+from src.results import SearchResults
+
+# repeated queries (eval reruns, UI retries) skip the embedding API call
+_embed_query_cached = lru_cache(maxsize=4096)(embed_query)
+
+# runs the independent BM25 and dense branches of hybrid search side by
+# side; the dense branch spends its time in FAISS/HTTP with the GIL released
+_POOL = ThreadPoolExecutor(max_workers=2)
 
 FAISS_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "faiss.index")
 
+# flat/IVF kernels parallelize over the query batch dimension;
+# FAISS_THREADS pins this for reproducible benchmarking
+faiss.omp_set_num_threads(int(os.getenv("FAISS_THREADS", os.cpu_count())))
+
+# the generic (no-SIMD) wheel is 3-5x slower on the scan kernels —
+# make it obvious when that's what got installed
+if "avx" not in faiss.get_compile_options().lower():
+    print("  !! faiss compiled without AVX "
+          f"(options: {faiss.get_compile_options().strip()})")
+
+
+def _int64_id(chunk_id):
+    """Stable int64 label for a string chunk id (63 bits of blake2b)."""
+    digest = hashlib.blake2b(chunk_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") >> 1
+
 
 class DenseRetriever:
     """Cosine-similarity search over chunk embeddings using FAISS."""
 
-    def __init__(self):
+    def __init__(self, index_type="hnsw"):
+        self.index_type = index_type
         self.index = None
-        self.chunk_ids = []
+        self.chunk_ids = np.array([], dtype=object)
+        self._id_lookup = {}
+        self._dim = None
+        self._local = threading.local()
+
+    def _set_ef_search(self, top_k):
+        if self.index_type != "hnsw":
+            return
+        inner = self.index
+        if hasattr(inner, "index"):     # unwrap the IDMap
+            inner = faiss.downcast_index(inner.index)
+        inner.hnsw.efSearch = max(64, top_k * 8)
+
+    def _query_buffer(self):
+        # reused (1, dim) scratch row per thread — no allocation per query
+        buf = getattr(self._local, "q_buf", None)
+        if buf is None or buf.shape[1] != self._dim:
+            buf = np.empty((1, self._dim), dtype=np.float32)
+            self._local.q_buf = buf
+        return buf
 
-    def build(self, chunks):
-        embeddings = []
-        self.chunk_ids = []
+    def _new_index(self, dim, n_vectors):
+        if self.index_type == "flat":
+            return faiss.IndexFlatIP(dim)
+        if self.index_type == "hnsw":
+            # graph-based ANN: sub-linear search instead of a full scan,
+            # near-exact recall at these corpus sizes
+            index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            return index
+        if self.index_type == "sq8":
+            # int8 scalar quantization: 4x less scan bandwidth than FP32
+            # with near-flat recall, exact scan otherwise
+            return faiss.IndexScalarQuantizer(
+                dim, faiss.ScalarQuantizer.QT_8bit,
+                faiss.METRIC_INNER_PRODUCT)
+        if self.index_type == "ivfpq":
+            # 4-bit PQ codes scanned with SIMD LUT kernels: ~16-32x less
+            # memory traffic than flat FP32 at some recall cost
+            nlist = max(1, int(4 * math.sqrt(n_vectors)))
+            m = dim // 4
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFPQFastScan(
+                quantizer, dim, nlist, m, 4,
+                faiss.METRIC_INNER_PRODUCT)
+            index.nprobe = 16
+            # OPQ rotation decorrelates dimensions before PQ coding —
+            # train-time FLOPs for materially better recall per code byte
+            opq = faiss.OPQMatrix(dim, m)
+            return faiss.IndexPreTransform(opq, index)
+        raise ValueError(f"unknown index type: {self.index_type}")
 
-        for c in chunks:
-            if c.get("embedding"):
-                embeddings.append(c["embedding"])
-                self.chunk_ids.append(c["chunk_id"])
+    def build(self, chunks, embeddings=None, normalized=False):
+        if embeddings is not None:
+            vecs = np.ascontiguousarray(embeddings, dtype=np.float32)
+            ids = [c["chunk_id"] for c in chunks]
+        else:
+            # preallocate once and fill row-by-row: np.array over a list
+            # of per-chunk lists copies through the object-array path and
+            # briefly holds two copies of the matrix
+            valid = [c for c in chunks if c.get("embedding") is not None]
+            ids = [c["chunk_id"] for c in valid]
+            dim = len(valid[0]["embedding"]) if valid else 0
+            vecs = np.empty((len(valid), dim), dtype=np.float32)
+            for i, c in enumerate(valid):
+                vecs[i] = c["embedding"]
+        self.chunk_ids = np.array(ids, dtype=object)
 
-        if not embeddings:
+        if vecs.size == 0:
             print("  !! no embeddings to index")
             return
 
-        vecs = np.array(embeddings, dtype=np.float32)
-        faiss.normalize_L2(vecs)       
+        # producers that already emit unit-norm rows (the .npy sidecar)
+        # say so and skip this extra pass over the whole matrix
+        if not normalized:
+            faiss.normalize_L2(vecs)
 
         dim = vecs.shape[1]
-        self.index = faiss.IndexFlatIP(dim)
-        self.index.add(vecs)
-        print(f"  FAISS index built – {len(self.chunk_ids)} vectors, dim={dim}")
+        self._dim = dim
+        inner = self._new_index(dim, vecs.shape[0])
+        if not inner.is_trained:
+            inner.train(vecs)
+
+        # ids live inside the index: search returns chunk-id labels, not
+        # positions, so results no longer depend on insertion order
+        int_ids = np.array([_int64_id(cid) for cid in ids], dtype=np.int64)
+        self.index = faiss.IndexIDMap2(inner)
+        self.index.add_with_ids(vecs, int_ids)
+        self._id_lookup = dict(zip(int_ids.tolist(), ids))
+        print(f"  FAISS index built – {len(self.chunk_ids)} vectors, "
+              f"dim={dim}, type={self.index_type}")
 
     def save(self, path=None):
         path = path or FAISS_PATH
         os.makedirs(os.path.dirname(path), exist_ok=True)
         faiss.write_index(self.index, path)
-        np.save(path + ".ids.npy", np.array(self.chunk_ids))
+        np.save(path + ".ids.npy", self.chunk_ids)
 
     def load(self, path=None):
         path = path or FAISS_PATH
-        self.index = faiss.read_index(path)
-        self.chunk_ids = np.load(path + ".ids.npy", allow_pickle=True).tolist()
+        # demand-page the vector storage from the OS cache instead of
+        # eagerly reading it; worker processes then share the pages
+        self.index = faiss.read_index(
+            path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        self.chunk_ids = np.load(path + ".ids.npy", allow_pickle=True)
+        self._id_lookup = {_int64_id(cid): cid
+                           for cid in self.chunk_ids.tolist()}
+        self._dim = self.index.d
+
+    def _format_results(self, scores_row, labels_row):
+        mask = labels_row != -1
+        ids = np.array(
+            [self._id_lookup[label] for label in labels_row[mask].tolist()],
+            dtype=object)
+        return SearchResults.from_ranked(
+            ids, scores_row[mask].astype(np.float64, copy=False))
 
     def search(self, query, top_k=5):
-        q = np.array([embed_query(query)], dtype=np.float32)
-        faiss.normalize_L2(q)
+        q = self._query_buffer()
+        np.copyto(q, _embed_query_cached(query))
+        if not UNIT_NORM:
+            faiss.normalize_L2(q)
+
+        self._set_ef_search(top_k)
+
+        scores, labels = self.index.search(q, top_k)
+        return self._format_results(scores[0], labels[0])
+
+    def search_batch(self, queries, top_k=5):
+        """Search many queries with one FAISS call.
+
+        FAISS parallelizes over the query batch and tiles the scan so
+        each block of index vectors is reused across every query while
+        it is hot in cache. That matters because dense search here is
+        memory-bound: throughput tracks how many index bytes stream
+        through the cache, not arithmetic, so the wins come from layout
+        (one stacked call instead of per-query scans) and byte width
+        (the sq8/ivfpq index types), not Python-side SIMD tricks. Past
+        ~1M vectors, switch index_type to "ivfpq" so only nprobe/nlist
+        of the data is scanned per query.
+        """
+        q = np.array([_embed_query_cached(query) for query in queries],
+                     dtype=np.float32)
+        if not UNIT_NORM:
+            faiss.normalize_L2(q)
+
+        self._set_ef_search(top_k)
+
+        scores, labels = self.index.search(q, top_k)
+        return [self._format_results(scores[i], labels[i])
+                for i in range(len(queries))]
 
-        scores, indices = self.index.search(q, top_k)
+    # alias: "many" reads better at call sites that loop over eval sets
+    search_many = search_batch
 
-        results = []
-        for rank, (score, idx) in enumerate(zip(scores[0], indices[0]), 1):
-            if idx == -1:
-                continue
-            results.append({
-                "chunk_id": self.chunk_ids[idx],
-                "score": float(score),
-                "rank": rank,
-            })
-        return results
 
 
+# below this many items the ndarray setup costs more than the dict loop
+_RRF_VECTORIZE_MIN = 64
+# above this many items the JIT'd scatter-add beats np.add.at
+_RRF_JIT_MIN = 4096
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _rrf_accumulate(inv, weights, n_unique):
+        # np.add.at is unbuffered but still element-dispatched; this
+        # lowers the scatter-add to a native loop
+        acc = np.zeros(n_unique)
+        for i in range(inv.size):
+            acc[inv[i]] += weights[i]
+        return acc
+
 
 def reciprocal_rank_fusion(result_lists, k=60):
     """
-    Merge several ranked lists with RRF.
+    Merge several ranked SearchResults with RRF.
     """
-    rrf_scores = {}
+    result_lists = [r for r in result_lists if len(r)]
+    if sum(len(r) for r in result_lists) < _RRF_VECTORIZE_MIN:
+        return _rrf_python(result_lists, k)
+
+    all_ids = np.concatenate([r.chunk_ids for r in result_lists])
+    all_scores = np.concatenate([1.0 / (k + r.ranks) for r in result_lists])
+
+    # group-by chunk_id and sum, all in C
+    uniq, inv = np.unique(all_ids, return_inverse=True)
+    if _rrf_ext is not None and all_ids.size >= _RRF_JIT_MIN:
+        acc = _rrf_ext.accumulate(inv.astype(np.int64), all_scores, len(uniq))
+    elif numba is not None and all_ids.size >= _RRF_JIT_MIN:
+        acc = _rrf_accumulate(inv.astype(np.int64), all_scores, len(uniq))
+    else:
+        acc = np.zeros(len(uniq))
+        np.add.at(acc, inv, all_scores)
+    order = np.argsort(-acc)
+
+    return SearchResults.from_ranked(uniq[order], acc[order])
+
+
+_RRF_WEIGHTS = {}
+
+
+def _rrf_weight_table(k, n):
+    """1/(k+rank) for ranks 1..n, grown once per k and reused."""
+    weights = _RRF_WEIGHTS.setdefault(k, [])
+    while len(weights) < n:
+        weights.append(1.0 / (k + len(weights) + 1))
+    return weights
+
+
+def _rrf_python(result_lists, k):
+    rrf_scores = defaultdict(float)
 
     for results in result_lists:
-        for item in results:
-            cid = item["chunk_id"]
-            rrf_scores[cid] = rrf_scores.get(cid, 0.0) + 1.0 / (k + item["rank"])
+        # both retrievers emit dense ranks, so rank == position + 1 and
+        # the precomputed table replaces a dict read and a division per item
+        weights = _rrf_weight_table(k, len(results))
+        for pos, cid in enumerate(results.chunk_ids.tolist()):
+            rrf_scores[cid] += weights[pos]
 
     ranked = sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True)
 
-    return [
-        {"chunk_id": cid, "rrf_score": score, "rank": rank}
-        for rank, (cid, score) in enumerate(ranked, 1)
-    ]
+    return SearchResults.from_ranked(
+        np.array([cid for cid, _ in ranked], dtype=object),
+        np.array([score for _, score in ranked]))
+
+
+# short-circuit thresholds for hybrid search: a top BM25 score this high
+# with this much of a gap to rank 2 means an exact phrase match, and the
+# dense branch (an embedding API call) cannot improve on it.
+# Calibrate on a dev set when the corpus changes.
+BM25_EXACT_THRESH = 25.0
+BM25_EXACT_GAP = 10.0
+
+
+def _bm25_dominant(results):
+    if len(results) == 0 or results.scores[0] <= BM25_EXACT_THRESH:
+        return False
+    return (len(results) < 2
+            or results.scores[0] - results.scores[1] > BM25_EXACT_GAP)
 
 
 class HybridRetriever:
@@ -90,19 +301,44 @@ class HybridRetriever:
         self.bm25 = BM25Index()
         self.dense = DenseRetriever()
 
-    def build(self, chunks):
+    def build(self, chunks, embeddings=None, normalized=False):
         self.bm25.build(chunks)
-        self.dense.build(chunks)
+        self.dense.build(chunks, embeddings, normalized=normalized)
 
     def search(self, query, top_k=5, method="rrf"):
         if method == "bm25":
-            return self.bm25.search(query, top_k)
+            return self.bm25.search(query, top_k).to_dicts()
         elif method == "dense":
-            return self.dense.search(query, top_k)
+            return self.dense.search(query, top_k).to_dicts()
         elif method == "rrf":
+            # BM25 is a microsecond sparse matvec now, so run it first:
+            # a dominant exact match skips the dense branch (and its
+            # embedding API call) entirely
             bm25_res = self.bm25.search(query, top_k * 2)
+            if _bm25_dominant(bm25_res):
+                return bm25_res.head(top_k).to_dicts()
             dense_res = self.dense.search(query, top_k * 2)
             fused = reciprocal_rank_fusion([bm25_res, dense_res])
-            return fused[:top_k]
+            return fused.head(top_k).to_dicts()
+        else:
+            raise ValueError(f"unknown retrieval method: {method}")
+
+    def search_batch(self, queries, top_k=5, method="rrf"):
+        if method == "bm25":
+            return [r.to_dicts()
+                    for r in self.bm25.search_batch(queries, top_k)]
+        elif method == "dense":
+            return [r.to_dicts()
+                    for r in self.dense.search_batch(queries, top_k)]
+        elif method == "rrf":
+            # both branches are substantial at batch size — overlap them
+            dense_future = _POOL.submit(
+                self.dense.search_batch, queries, top_k * 2)
+            bm25_res = self.bm25.search_batch(queries, top_k * 2)
+            dense_res = dense_future.result()
+            return [
+                reciprocal_rank_fusion([b, d]).head(top_k).to_dicts()
+                for b, d in zip(bm25_res, dense_res)
+            ]
         else:
             raise ValueError(f"unknown retrieval method: {method}")